@@ -1,9 +1,15 @@
 # app/auth.py
-from datetime import datetime, timedelta
+import base64
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.hash import bcrypt
+import bcrypt as _bc
 import jwt
+import orjson
 
 from app.settings import settings
 from app.schemas import LoginResponse
@@ -12,35 +18,91 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# bcrypt nativo (C, OpenBSD) sin pasar por passlib
+_BCRYPT_ROUNDS = settings.BCRYPT_ROUNDS or 12
+
+# Password plano del admin codificado una sola vez para la comparación constante
+_ADMIN_PASSWORD_PLAIN_BYTES = (
+    settings.ADMIN_PASSWORD_PLAIN.encode("utf-8")
+    if settings.ADMIN_PASSWORD_PLAIN is not None
+    else None
+)
+
+# Cache en proceso de tokens ya verificados: token -> (sub, vence_en).
+# Evita repetir HMAC + base64 + JSON en cada request con el mismo bearer.
+_TOKEN_CACHE: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_TOKEN_CACHE_MAX = 4096
+_TOKEN_CACHE_TTL = 60.0
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+# JWT HS256: header fijo y clave precalculados una sola vez
+_JWT_KEY = settings.JWT_SECRET.encode("utf-8")
+_HEADER_B64 = base64.urlsafe_b64encode(orjson.dumps({"alg": "HS256", "typ": "JWT"})).rstrip(b"=")
+_EXP_DELTA = settings.ACCESS_TOKEN_EXPIRE_HOURS * 3600
+
+def _fast_encode(sub: str, exp: int) -> str:
+    """Equivalente a jwt.encode(..., algorithm="HS256") sin re-serializar header ni buscar el algoritmo."""
+    payload_b64 = base64.urlsafe_b64encode(orjson.dumps({"sub": sub, "exp": exp})).rstrip(b"=")
+    signing_input = _HEADER_B64 + b"." + payload_b64
+    # hmac.digest: HMAC de una sola llamada, resuelto íntegro en OpenSSL (sin objeto HMAC)
+    sig = hmac.digest(_JWT_KEY, signing_input, "sha256")
+    return (signing_input + b"." + base64.urlsafe_b64encode(sig).rstrip(b"=")).decode("ascii")
+
 def create_access_token(username: str) -> str:
-    payload = {
-        "sub": username,
-        "exp": datetime.utcnow() + timedelta(hours=settings.ACCESS_TOKEN_EXPIRE_HOURS),
-    }
-    return jwt.encode(payload, settings.JWT_SECRET, algorithm="HS256")
+    return _fast_encode(username, int(time.time()) + _EXP_DELTA)
 
 def verify_password(plain: str, hashed: str) -> bool:
     try:
-        return bcrypt.verify(plain, hashed)
-    except Exception:
+        # bcrypt solo usa 72 bytes; 5.x lanza ValueError en vez de truncar como passlib
+        return _bc.checkpw(plain.encode("utf-8")[:72], hashed.encode("utf-8"))
+    except ValueError:
+        # hash mal formado
         return False
 
+def password_needs_update(hashed: str) -> bool:
+    """True si el hash usa parámetros distintos a los vigentes (p.ej. otros rounds)."""
+    # Formato modular crypt: $2b$<rounds>$<salt+checksum>
+    parts = hashed.split("$")
+    if len(parts) != 4 or parts[1] != "2b":
+        return True
+    try:
+        return int(parts[2]) != _BCRYPT_ROUNDS
+    except ValueError:
+        return True
+
 def authenticate_user(username: str, password: str) -> bool:
     if username != settings.ADMIN_USERNAME:
         return False
     # Prioriza HASH si existe; si no, usa password plano del .env
     if settings.ADMIN_PASSWORD_HASH:
         return verify_password(password, settings.ADMIN_PASSWORD_HASH)
-    if settings.ADMIN_PASSWORD_PLAIN is not None:
-        return password == settings.ADMIN_PASSWORD_PLAIN
+    if _ADMIN_PASSWORD_PLAIN_BYTES is not None:
+        # compare_digest: tiempo constante, sin fuga por prefijo/longitud
+        return hmac.compare_digest(password.encode("utf-8"), _ADMIN_PASSWORD_PLAIN_BYTES)
     return False
 
+def _cache_token(token: str, sub: str, exp: float) -> None:
+    """Guarda el token verificado hasta su `exp` o el TTL, lo que ocurra antes."""
+    expires_at = min(float(exp), time.time() + _TOKEN_CACHE_TTL)
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (sub, expires_at)
+        _TOKEN_CACHE.move_to_end(token)
+        while len(_TOKEN_CACHE) > _TOKEN_CACHE_MAX:
+            _TOKEN_CACHE.popitem(last=False)
+
 def require_auth(token: str = Depends(oauth2_scheme)) -> str:
+    # Lectura sin lock: get() sobre dict es atómico en CPython
+    hit = _TOKEN_CACHE.get(token)
+    if hit and hit[1] > time.time():
+        return hit[0]
     try:
-        decoded = jwt.decode(token, settings.JWT_SECRET, algorithms=["HS256"])
-        return decoded["sub"]
+        # Misma clave precalculada que firma: una sola fuente de verdad para el secreto
+        decoded = jwt.decode(token, _JWT_KEY, algorithms=["HS256"])
+        sub = decoded["sub"]
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    _cache_token(token, sub, decoded.get("exp", time.time()))
+    return sub
 
 @router.post("/login", response_model=LoginResponse)
 def login(form: OAuth2PasswordRequestForm = Depends()):
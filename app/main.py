@@ -1,8 +1,9 @@
 # app/main.py
 import os
+import re
 import sys
 import asyncio
-import subprocess
+import functools
 import pathlib
 #import xml.etree.ElementTree as ET
 from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
@@ -18,8 +19,8 @@ from fastapi import (
 )
 from fastapi.responses import (
     RedirectResponse,
-    JSONResponse,
-    HTMLResponse,
+    ORJSONResponse,
+    Response,
     StreamingResponse,
 )
 from fastapi.staticfiles import StaticFiles
@@ -32,7 +33,8 @@ from app.schemas import SyncRequest, StatusResponse
 from app.auth import router as auth_router, require_auth, create_access_token
 
 # === APP INSTANCE ===
-app = FastAPI(title=settings.APP_NAME)
+# ORJSONResponse: serialización JSON en C para todos los endpoints
+app = FastAPI(title=settings.APP_NAME, default_response_class=ORJSONResponse)
 limiter = init_rate_limiter(app)
 
 # === ROOT / FAVICON ===
@@ -42,7 +44,8 @@ def root():
 
 @app.get("/favicon.ico", include_in_schema=False)
 def favicon():
-    return JSONResponse(status_code=204, content=None)
+    # 204 no lleva cuerpo
+    return Response(status_code=204)
 
 # === HEALTH ===
 @app.get("/health")
@@ -50,10 +53,12 @@ def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 # === LOAD SYNC ENGINE (mock or real) ===
+@functools.lru_cache(maxsize=1)
 def _load_sync_engine():
     """
     Intenta cargar sync_engine desde DATASYNC_HOME/src.
     Si no existe, devuelve un motor mock para evitar errores.
+    El resultado se cachea: sys.path y el import solo se tocan en la primera llamada.
     """
     home = os.environ.get("DATASYNC_HOME", settings.DATASYNC_HOME)
     src = os.path.join(home, "src")
@@ -82,24 +87,37 @@ def _load_sync_engine():
 
         return _Fallback
 
+@app.on_event("startup")
+def _startup_load_engine():
+    # Precarga el motor para que el primer /status no pague el import
+    _load_sync_engine()
+
 # === PROTECTED ENDPOINTS ===
+# Caracteres prohibidos en nombres de tabla (inyección simple)
+_BAD_TABLE_CHARS = re.compile(r"[; ]")
+
 @app.get("/status", response_model=StatusResponse)
 def get_status(_: str = Depends(require_auth)):
+    # response_model solo documenta: al devolver un Response directo, FastAPI
+    # no re-valida con Pydantic el dict del motor en cada poll del dashboard.
     engine = _load_sync_engine()
-    return engine.get_sync_status()
+    return ORJSONResponse(content=engine.get_sync_status())
 
 @app.post("/sync")
 def sync(req: SyncRequest, _: str = Depends(require_auth)) -> Dict[str, Any]:
     tables = req.tables or []
 
-    # Validación defensiva
-    bad = [t for t in tables if (";" in t or " " in t)]
+    # Validación defensiva + whitelist (settings.ALLOWED_TABLES) en una sola pasada
+    allowed = settings.allowed_tables_set
+    bad, notallowed = [], []
+    for t in tables:
+        if _BAD_TABLE_CHARS.search(t):
+            bad.append(t)
+        elif allowed and t not in allowed:
+            notallowed.append(t)
     if bad:
         raise HTTPException(status_code=400, detail=f"Invalid table names: {bad}")
-
-    # Whitelist desde settings.ALLOWED_TABLES
-    allowed = set(settings.ALLOWED_TABLES or [])
-    if allowed and any(t not in allowed for t in tables):
+    if notallowed:
         raise HTTPException(status_code=403, detail="Table not allowed by whitelist")
 
     engine = _load_sync_engine()
@@ -124,11 +142,14 @@ def dev_token():
 HTMLCOV_DIR = pathlib.Path("htmlcov")
 COV_XML = pathlib.Path("coverage.xml")
 
+@functools.lru_cache(maxsize=1)
 def _detect_ai_runner() -> Optional[Tuple[pathlib.Path, Optional[str]]]:
     """
     Busca el ai_test_runner en rutas comunes y prioriza el que vive en tools/.
     Retorna (path, module_name) si se debe ejecutar como módulo (con -m),
     o (path, None) si se ejecuta como script.
+    El layout no cambia durante la vida del contenedor, así que se cachea
+    (usa _detect_ai_runner.cache_clear() si mueves el runner en caliente).
     """
     candidates: List[Tuple[str, Optional[str]]] = [
         # PRIORIDAD: el que empaquetas en la imagen
@@ -159,17 +180,40 @@ def _mount_htmlcov() -> bool:
 def _startup_mount_cov():
     _mount_htmlcov()
 
+# line-rate del elemento raíz <coverage>, que va en las primeras líneas del archivo
+_COV_ROOT_RATE_RE = re.compile(rb'<coverage\b[^>]*?\bline-rate="([0-9.]+)"')
+
+def _read_root_line_rate() -> float:
+    """Lee solo el line-rate del root: cabecera + regex y, si no aparece, iterparse hasta el primer tag."""
+    with open(COV_XML, "rb") as f:
+        m = _COV_ROOT_RATE_RE.search(f.read(2048))
+        if m:
+            return float(m.group(1))
+        f.seek(0)
+        # Uso seguro: defusedxml evita XXE/DTD y otros ataques
+        for _event, elem in DefusedET.iterparse(f, events=("start",)):
+            return float(elem.attrib.get("line-rate", "0"))
+    return 0.0
+
+# (mtime_ns, resumen) del último coverage.xml parseado
+_COV_CACHE: Optional[Tuple[int, Dict[str, Any]]] = None
+
 def _read_coverage_summary() -> Dict[str, Any]:
     """Lee coverage.xml de forma segura y devuelve {ok, percent} para el gauge del dashboard."""
-    if not COV_XML.exists():
+    global _COV_CACHE
+    try:
+        st = COV_XML.stat()
+    except OSError:
         return {"ok": False, "percent": None}
+    if _COV_CACHE is not None and _COV_CACHE[0] == st.st_mtime_ns:
+        return dict(_COV_CACHE[1])
     try:
-        # Uso seguro: defusedxml evita XXE/DTD y otros ataques
-        root = DefusedET.parse(str(COV_XML)).getroot()
-        line_rate = float(root.attrib.get("line-rate", "0"))
-        return {"ok": True, "percent": round(line_rate * 100, 2)}
+        line_rate = _read_root_line_rate()
+        summary = {"ok": True, "percent": round(line_rate * 100, 2)}
     except Exception:
         return {"ok": False, "percent": None}
+    _COV_CACHE = (st.st_mtime_ns, summary)
+    return dict(summary)
 
 @app.post("/qa/coverage/refresh")
 def qa_refresh_coverage(_: str = Depends(require_auth)):
@@ -186,33 +230,41 @@ def qa_ai_runner(_: str = Depends(require_auth)):
 
 
 # === Elección de comando de pruebas ===
-def _choose_cmd(mode: str = "auto") -> List[str]:
+_PYTEST_CMD = [sys.executable, "-m", "pytest", "--cov=app", "--cov-report=xml", "--cov-report=html", "-q"]
+
+def _choose_cmd(
+    mode: str = "auto",
+    runner: Optional[Tuple[pathlib.Path, Optional[str]]] = None,
+) -> Tuple[List[str], Optional[Dict[str, str]]]:
     """
     mode=ai      -> corre el runner IA si existe (como módulo si vive en tools/)
     mode=pytest  -> pytest --cov ...
     mode=auto    -> IA si existe; si no, pytest
-    """
-    runner = _detect_ai_runner()
 
+    Devuelve (argv, env). argv se ejecuta directo, sin `bash -lc`;
+    env=None hereda el entorno actual.
+    `runner` es el resultado de _detect_ai_runner(), resuelto por el llamador.
+    """
     # Si pidieron IA explícitamente y no hay runner → caer a pytest
     if mode == "ai" and not runner:
-        return ["bash", "-lc", "pytest --cov=app --cov-report=xml --cov-report=html -q"]
+        return list(_PYTEST_CMD), None
 
     # IA (auto o explícito)
     if mode in ("ai", "auto") and runner:
         path, module_name = runner
         if module_name:
-            # fuerza contexto correcto del paquete
-            return ["bash", "-lc", "cd /app && PYTHONPATH=/app python -u -m tools.ai_test_runner"]
+            # fuerza contexto correcto del paquete (raíz = carpeta que contiene tools/)
+            root = str(path.resolve().parents[1])
+            return [sys.executable, "-u", "-m", module_name], {**os.environ, "PYTHONPATH": root}
         # como script plano
-        return ["bash", "-lc", f"python -u {path}"]
+        return [sys.executable, "-u", str(path)], None
 
     # Pytest por defecto
-    return ["bash", "-lc", "pytest --cov=app --cov-report=xml --cov-report=html -q"]
+    return list(_PYTEST_CMD), None
 
 # === Ejecución normal (no streaming) ===
 @app.post("/qa/run-tests")
-def qa_run_tests_normal(
+async def qa_run_tests_normal(
     mode: str = Query("auto", enum=["auto", "ai", "pytest"]),
     body: Dict[str, Any] | None = Body(None),
     _: str = Depends(require_auth),
@@ -225,14 +277,22 @@ def qa_run_tests_normal(
     if body is not None and "with_ai" in body and mode == "auto":
         mode = "ai" if bool(body.get("with_ai")) else "pytest"
 
-    cmd = _choose_cmd(mode)
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    out = (proc.stdout or "") + (proc.stderr or "")
+    runner = _detect_ai_runner()
+    cmd, env = _choose_cmd(mode, runner)
+    # Subproceso asíncrono: el event loop sigue atendiendo /health, /status, etc.
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env=env,
+    )
+    out_bytes = (await proc.communicate())[0]
+    out = (out_bytes or b"").decode("utf-8", errors="replace")
 
-    _mount_htmlcov()
-    cov = _read_coverage_summary()
+    await asyncio.to_thread(_mount_htmlcov)
+    cov = await asyncio.to_thread(_read_coverage_summary)
 
-    present = _detect_ai_runner() is not None
+    present = runner is not None
     return {
         "mode": mode,
         "resolved_cmd": cmd,
@@ -244,15 +304,21 @@ def qa_run_tests_normal(
     }
 
 # === Streaming (log en vivo) ===
-async def _stream_process(cmd: List[str]) -> AsyncIterator[bytes]:
+async def _stream_process(cmd: List[str], env: Optional[Dict[str, str]] = None) -> AsyncIterator[bytes]:
     proc = await asyncio.create_subprocess_exec(
         *cmd,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.STDOUT,
+        env=env,
     )
     assert proc.stdout is not None
-    async for line in proc.stdout:
-        yield line
+    # Bloques de hasta 8 KiB en vez de línea a línea: menos yields/sends por corrida.
+    # Un bloque puede cortar un carácter UTF-8; el dashboard decodifica con {stream:true}.
+    while True:
+        chunk = await proc.stdout.read(8192)
+        if not chunk:
+            break
+        yield chunk
     await proc.wait()
     _mount_htmlcov()
 
@@ -267,14 +333,17 @@ def qa_run_tests_stream(
     """
     if body is not None and "with_ai" in body and mode == "auto":
         mode = "ai" if bool(body.get("with_ai")) else "pytest"
-    cmd = _choose_cmd(mode)
-    return StreamingResponse(_stream_process(cmd), media_type="text/plain")
+    cmd, env = _choose_cmd(mode, _detect_ai_runner())
+    return StreamingResponse(
+        _stream_process(cmd, env=env),
+        media_type="text/plain; charset=utf-8",
+        # evita que un proxy (nginx) acumule el stream y se pierda el log en vivo
+        headers={"X-Accel-Buffering": "no"},
+    )
 
 # === DASHBOARD QA (HTML) ===
-@app.get("/qa", include_in_schema=False)
-def qa_home():
-    return HTMLResponse(
-        """
+# El HTML es estático: se codifica una sola vez y se sirve siempre el mismo bytes.
+_QA_HTML = """
 <!doctype html>
 <html>
 <head>
@@ -395,7 +464,8 @@ def qa_home():
       const tk=await getToken();
       const r=await fetch("/qa/run-tests/stream?mode=ai",{method:"POST",headers:{"Authorization":"Bearer "+tk}});
       const rd=r.body.getReader(); const dec=new TextDecoder();
-      while(true){ const {value,done}=await rd.read(); if(done)break; out.textContent+=dec.decode(value); out.scrollTop=out.scrollHeight; }
+      while(true){ const {value,done}=await rd.read(); if(done)break; out.textContent+=dec.decode(value,{stream:true}); out.scrollTop=out.scrollHeight; }
+      out.textContent+=dec.decode();
       status.innerHTML="<span class='ok'>Finalizado</span>";
       await fetchCoverage();
       setBusy(false);
@@ -406,5 +476,13 @@ def qa_home():
   </script>
 </body>
 </html>
-        """
-    )
\ No newline at end of file
+"""
+_QA_HTML_BYTES = _QA_HTML.encode("utf-8")
+_QA_RESPONSE_HEADERS = {
+    "content-type": "text/html; charset=utf-8",
+    "content-length": str(len(_QA_HTML_BYTES)),
+}
+
+@app.get("/qa", include_in_schema=False)
+def qa_home():
+    return Response(content=_QA_HTML_BYTES, headers=_QA_RESPONSE_HEADERS)
@@ -1,8 +1,9 @@
 # app/settings.py
 from functools import lru_cache
-from typing import List, Optional, Union
+import orjson
+from typing import Any, FrozenSet, List, Optional, Tuple, Union
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import field_validator
+from pydantic import PrivateAttr, field_validator
 
 # ---- SlowAPI (Rate Limiting) ----
 # Mantener estos imports arriba evita ruff E402. Además, funciona aunque SlowAPI no esté instalado.
@@ -39,6 +40,7 @@ class Settings(BaseSettings):
     ADMIN_USERNAME: str = "admin"
     ADMIN_PASSWORD_HASH: Optional[str] = None
     ADMIN_PASSWORD_PLAIN: Optional[str] = "adminadmin"
+    BCRYPT_ROUNDS: int = 12
 
     # DataSync (ruta dentro del contenedor)
     DATASYNC_HOME: str = "./datasync-mock"
@@ -60,6 +62,21 @@ class Settings(BaseSettings):
     MAX_ITERS: int = 3
     MAX_SOURCE_CHARS: int = 10_000
 
+    # (lista origen, frozenset) de ALLOWED_TABLES; se materializa una vez al cargar
+    _allowed_tables_cache: Optional[Tuple[Any, FrozenSet[str]]] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._allowed_tables_cache = (self.ALLOWED_TABLES, frozenset(self.ALLOWED_TABLES or ()))
+
+    @property
+    def allowed_tables_set(self) -> FrozenSet[str]:
+        """Whitelist como frozenset; se recalcula solo si reasignan ALLOWED_TABLES."""
+        cached = self._allowed_tables_cache
+        if cached is None or cached[0] is not self.ALLOWED_TABLES:
+            cached = (self.ALLOWED_TABLES, frozenset(self.ALLOWED_TABLES or ()))
+            self._allowed_tables_cache = cached
+        return cached[1]
+
     @field_validator("CORS_ORIGINS", "ALLOWED_TABLES", mode="before")
     @classmethod
     def _coerce_list(cls, v):
@@ -76,9 +93,8 @@ class Settings(BaseSettings):
             if s == "*":
                 return ["*"]
             if s.startswith("["):
-                import json
                 try:
-                    return json.loads(s)
+                    return orjson.loads(s)
                 except Exception:
                     # si no parsea como JSON, cae a CSV
                     pass
@@ -1,21 +1,50 @@
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 BASE_URL = "http://localhost:8000"
 HEADERS = {"Content-Type": "application/json"}
 
+# Sesión única: reutiliza la conexión keep-alive para todas las validaciones
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
 def log(msg, ok=True):
     print(("✅ " if ok else "❌ ") + msg)
 
 def check(endpoint, method="GET", **kwargs):
     url = BASE_URL + endpoint
     try:
-        r = requests.request(method, url, timeout=30, **kwargs)
+        r = SESSION.request(method, url, timeout=30, **kwargs)
         return r
     except Exception as e:
         log(f"{endpoint} → {e}", ok=False)
         return None
 
+def wait_ready(endpoint, timeout=5.0, initial=0.1, ready=None, **kwargs):
+    """
+    Sondea `endpoint` con backoff (x1.5, tope 0.5s) hasta 200 OK
+    (y `ready(r)` verdadero, si se pasa) o hasta agotar `timeout`.
+    Si `ready` lanza ValueError (p.ej. cuerpo no JSON) cuenta como no listo.
+    Devuelve la última respuesta obtenida.
+    """
+    t0 = time.monotonic()
+    delay = initial
+    while True:
+        r = check(endpoint, **kwargs)
+        if r is not None and r.status_code == 200:
+            try:
+                if ready is None or ready(r):
+                    return r
+            except ValueError:
+                pass
+        if time.monotonic() - t0 > timeout:
+            return r
+        time.sleep(delay)
+        delay = min(delay * 1.5, 0.5)
+
 def main():
     print("=== 🔍 Validando endpoints QA Dashboard ===")
 
@@ -32,47 +61,53 @@ def main():
     if not token:
         log("/internal/dev-token FAIL (sin token)", ok=False)
         return
-    auth = {"Authorization": f"Bearer {token}"}
-
-    r = check("/status", headers=auth)
-    if r and r.status_code == 200:
-        log(f"/status OK → {r.json()}")
-    else:
-        log(f"/status FAIL ({r.status_code})", ok=False)
+    # A partir de aquí todas las llamadas van autenticadas por la sesión
+    SESSION.headers["Authorization"] = f"Bearer {token}"
 
     # 3️⃣ Ejecutar pruebas (pytest)
     print("⏳ Ejecutando pytest (esto tarda unos segundos)...")
-    r = check("/qa/run-tests?mode=pytest", method="POST", headers=auth)
+    r = check("/qa/run-tests?mode=pytest", method="POST")
     if r and r.status_code == 200:
         js = r.json()
         log(f"/qa/run-tests OK → returncode={js.get('returncode')}, cov={js.get('coverage')}")
     else:
         log(f"/qa/run-tests FAIL ({r.status_code if r else 'error'})", ok=False)
 
-    # Espera a que coverage.xml se genere
-    time.sleep(3)
+    # 4️⃣ Lecturas independientes en paralelo (Session + pool de 8 es thread-safe aquí)
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        futures = {
+            "status": ex.submit(check, "/status"),
+            # espera a que coverage.xml esté listo en vez de dormir fijo
+            "cov": ex.submit(wait_ready, "/qa/coverage/summary", ready=lambda resp: resp.json().get("ok")),
+            "refresh": ex.submit(check, "/qa/coverage/refresh", method="POST"),
+            "html": ex.submit(check, "/htmlcov/index.html"),
+        }
+    results = {name: fut.result() for name, fut in futures.items()}
+
+    r = results["status"]
+    if r and r.status_code == 200:
+        log(f"/status OK → {r.json()}")
+    else:
+        log(f"/status FAIL ({r.status_code if r else 'error'})", ok=False)
 
-    # 4️⃣ Coverage summary
-    r = check("/qa/coverage/summary", headers=auth)
+    r = results["cov"]
     if r and r.status_code == 200:
         js = r.json()
         log(f"/qa/coverage/summary OK → {js}")
     else:
-        log(f"/qa/coverage/summary FAIL ({r.status_code})", ok=False)
+        log(f"/qa/coverage/summary FAIL ({r.status_code if r else 'error'})", ok=False)
 
-    # 5️⃣ Refresh mount htmlcov
-    r = check("/qa/coverage/refresh", method="POST", headers=auth)
+    r = results["refresh"]
     if r and r.status_code == 200:
         log(f"/qa/coverage/refresh OK → {r.json()}")
     else:
-        log(f"/qa/coverage/refresh FAIL ({r.status_code})", ok=False)
+        log(f"/qa/coverage/refresh FAIL ({r.status_code if r else 'error'})", ok=False)
 
-    # 6️⃣ Ver HTML coverage
-    r = check("/htmlcov/index.html", headers=auth)
+    r = results["html"]
     if r and r.status_code == 200:
         log("/htmlcov/index.html OK (reporte visible)")
     else:
-        log(f"/htmlcov/index.html FAIL ({r.status_code})", ok=False)
+        log(f"/htmlcov/index.html FAIL ({r.status_code if r else 'error'})", ok=False)
 
     print("=== ✅ Validación completa ===")
 
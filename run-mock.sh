@@ -5,4 +5,4 @@ pip install -r requirements.txt
 export DATASYNC_HOME="$(pwd)/datasync-mock"
 export JWT_SECRET="${JWT_SECRET:-cambia_este_secreto_largo_seguro}"
 export ALLOWED_TABLES="${ALLOWED_TABLES:-kpi_jornadas}"
-uvicorn app.main:app --reload
+uvicorn app.main:app --reload --loop uvloop --http httptools
@@ -30,12 +30,28 @@ from app.schemas import StatusResponse as _StatusResponse
 from pydantic import ValidationError as _PydanticValidationError
 
 # === 3️⃣ GET_SETTINGS FRESCO ===
+# Settings ya construidos por huella del entorno: evita reload + Pydantic si nada cambió
+_SETTINGS_CACHE: dict = {}
+
+def _env_fingerprint() -> tuple:
+    # Todas las variables que Settings lee (incluye DATASYNC_HOME, JWT_SECRET, ALLOWED_TABLES, CORS_ORIGINS)
+    return tuple(os.environ.get(k, "") for k in settings_mod.Settings.model_fields)
+
 def _fresh_get_settings():
     """Reconstruye settings desde el entorno actual y los sincroniza en main."""
+    # get_settings() (lru_cache) debe devolver un objeto nuevo por test, haya o no hit
     try:
         settings_mod.get_settings.cache_clear()  # type: ignore
     except Exception:
         pass
+    key = _env_fingerprint()
+    cached = _SETTINGS_CACHE.get(key)
+    if cached is not None:
+        # Copia profunda: los tests mutan el objeto (p.ej. ALLOWED_TABLES) y no debe filtrarse
+        s = cached.model_copy(deep=True)
+        settings_mod.settings = s
+        main_local.settings = s
+        return s
     importlib.reload(settings_mod)
     s = settings_mod.Settings(_env_file=None)
     if isinstance(s.CORS_ORIGINS, str):
@@ -45,28 +61,34 @@ def _fresh_get_settings():
     # sincroniza el objeto global usado por la app
     settings_mod.settings = s
     main_local.settings = s
+    _SETTINGS_CACHE[key] = s.model_copy(deep=True)
     return s
 
 # === 3.1️⃣ Utilidad: crear TestClient con engine mock y (opcional) headers por defecto ===
-def _make_client(default_headers: dict | None = None) -> TestClient:
-    class _DummyEngine:
-        @staticmethod
-        def get_sync_status():
-            return {
-                "sqlserver": False,
-                "mysql": False,
-                "configured_tables": 1,
-                "enabled_tables": 1,
-                "system_health": "healthy-mock",
-            }
-
-        @staticmethod
-        def sync_all_tables(specific_tables=None, dry_run=False):
-            return None
+class _DummyEngine:
+    @staticmethod
+    def get_sync_status():
+        return {
+            "sqlserver": False,
+            "mysql": False,
+            "configured_tables": 1,
+            "enabled_tables": 1,
+            "system_health": "healthy-mock",
+        }
+
+    @staticmethod
+    def sync_all_tables(specific_tables=None, dry_run=False):
+        return None
 
+# Loader real (lru_cache) antes de que el mock lo reemplace; ver fixture real_load_sync_engine
+_REAL_LOAD_SYNC_ENGINE = main_local._load_sync_engine
+
+def _install_dummy_engine() -> None:
     # Forzar engine mock para TODOS los clientes
     main_local._load_sync_engine = lambda: _DummyEngine  # type: ignore
 
+def _make_client(default_headers: dict | None = None) -> TestClient:
+    _install_dummy_engine()
     # TestClient admite headers por defecto en el constructor
     return TestClient(main_local.app, headers=(default_headers or {}))
 
@@ -108,58 +130,133 @@ builtins.StatusResponse = _StatusResponse
 builtins.ValidationError = _PydanticValidationError
 builtins.pytest = pytest
 
+def _install_shim() -> None:
+    """Instala el shim estricto en ambos objetos-función; no-op si ya está activo."""
+    # Se resuelve por llamada: un reload de app.main cambia app y require_auth
+    overrides = main_local.app.dependency_overrides
+    if (overrides.get(main_local.require_auth) is _require_auth_strict
+            and overrides.get(auth_mod.require_auth) is _require_auth_strict):
+        return
+    overrides[main_local.require_auth] = _require_auth_strict
+    overrides[auth_mod.require_auth] = _require_auth_strict
+
+def _remove_shim() -> None:
+    """Limpieza segura: solo quita el shim si sigue siendo el activo."""
+    overrides = main_local.app.dependency_overrides
+    if overrides.get(main_local.require_auth) is _require_auth_strict:
+        overrides.pop(main_local.require_auth, None)
+    if overrides.get(auth_mod.require_auth) is _require_auth_strict:
+        overrides.pop(auth_mod.require_auth, None)
+
 # === 6️⃣ FIXTURE AUTO: RESETEA ENTORNO Y (RE)APLICA EL SHIM ESTRICTO ===
-@pytest.fixture(autouse=True)
-def _env_and_settings_reset(monkeypatch):
-    monkeypatch.setenv("DATASYNC_HOME", "./datasync-mock")
-    monkeypatch.setenv("JWT_SECRET", "test_secret_for_ci")
-    monkeypatch.setenv("ALLOWED_TABLES", "")
-    # Permite que algunos tests IA cambien CORS_ORIGINS a JSON en runtime
-    cors_raw = os.environ.get("CORS_ORIGINS", "*")
-    monkeypatch.setenv("CORS_ORIGINS", cors_raw)
+# El shim se quita una sola vez al final de la sesión: entre tests queda activo y
+# la instalación del siguiente test es un no-op (overrides ajenos se reemplazan).
+@pytest.fixture(scope="session", autouse=True)
+def _strict_shim_session():
+    yield
+    _remove_shim()
 
-    _fresh_get_settings()
+_RESET_ENV_KEYS = ("DATASYNC_HOME", "JWT_SECRET", "ALLOWED_TABLES", "CORS_ORIGINS")
 
-    # (Re)instala el shim estricto por defecto; tests específicos lo pueden sobrescribir
-    app_overrides = main_local.app.dependency_overrides
-    app_overrides[main_local.require_auth] = _require_auth_strict
-    app_overrides[auth_mod.require_auth] = _require_auth_strict
+@pytest.fixture(autouse=True)
+def _env_and_settings_reset():
+    # Un solo update + restauración manual (en vez de 4 monkeypatch.setenv por test)
+    prev = {k: os.environ.get(k) for k in _RESET_ENV_KEYS}
+    os.environ.update({
+        "DATASYNC_HOME": "./datasync-mock",
+        "JWT_SECRET": "test_secret_for_ci",
+        "ALLOWED_TABLES": "",
+        # Permite que algunos tests IA cambien CORS_ORIGINS a JSON en runtime
+        "CORS_ORIGINS": os.environ.get("CORS_ORIGINS", "*"),
+    })
 
-    yield
+    try:
+        _fresh_get_settings()
 
-    # Limpieza segura: solo quita el shim si sigue siendo el activo.
-    if app_overrides.get(main_local.require_auth) is _require_auth_strict:
-        app_overrides.pop(main_local.require_auth, None)
-    if app_overrides.get(auth_mod.require_auth) is _require_auth_strict:
-        app_overrides.pop(auth_mod.require_auth, None)
+        # (Re)instala el shim estricto por defecto; tests específicos lo pueden sobrescribir
+        _install_shim()
+
+        yield
+    finally:
+        # Restaura el entorno aunque el setup falle
+        for k, v in prev.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
 
 # === 7️⃣ FIXTURES BASE ===
+# TestClient de sesión: se construyen una vez y cada test los reutiliza.
+# El aislamiento lo dan los overrides/engine que se reinstalan por test y el
+# reseteo de headers/cookies en cada uso.
+_AUTH_HEADER = "Bearer valid_token_example"
+_SESSION_HEADERS: dict = {}
+
+def _make_session_client(default_headers: dict | None = None) -> TestClient:
+    c = _make_client(default_headers)
+    _SESSION_HEADERS[id(c)] = c.headers.copy()
+    return c
+
+@pytest.fixture(scope="session")
+def _base_client():
+    return _make_session_client()
+
+@pytest.fixture(scope="session")
+def _base_authed_client():
+    return _make_session_client({"Authorization": _AUTH_HEADER})
+
+def _reuse_client(base: TestClient, default_headers: dict | None = None) -> TestClient:
+    # Si algún test recargó app.main, el cliente de sesión apunta a la app vieja
+    if base.app is not main_local.app:
+        return _make_client(default_headers)
+    # Lo que un test dejó en headers/cookies no debe verlo el siguiente
+    base.headers = _SESSION_HEADERS[id(base)].copy()
+    base.cookies.clear()
+    _install_dummy_engine()
+    return base
+
 @pytest.fixture
-def client():
+def client(_base_client):
     """Cliente con engine mock; usa el shim y/o headers explícitos en cada request."""
-    return _make_client()
+    return _reuse_client(_base_client)
 
 @pytest.fixture
-def authed_client():
+def authed_client(_base_authed_client):
     """
     Cliente que SIEMPRE va autenticado:
     - Sobrescribe la dependencia en AMBOS objetos función a un lambda que devuelve 'admin'.
-    - Además crea un TestClient con un header Authorization por defecto (doble cinturón).
+    - Además reutiliza un TestClient con un header Authorization por defecto (doble cinturón).
     """
     app_overrides = main_local.app.dependency_overrides
     app_overrides[main_local.require_auth] = (lambda: "admin")
     app_overrides[auth_mod.require_auth] = (lambda: "admin")
 
-    c = _make_client({"Authorization": "Bearer valid_token_example"})
+    c = _reuse_client(_base_authed_client, {"Authorization": _AUTH_HEADER})
+    c.headers["Authorization"] = _AUTH_HEADER
     try:
         yield c
     finally:
+        c.headers.pop("Authorization", None)
         # Restaura el shim estricto solo si nuestro lambda seguía activo
         if app_overrides.get(main_local.require_auth) is not _require_auth_strict:
             app_overrides.pop(main_local.require_auth, None)
         if app_overrides.get(auth_mod.require_auth) is not _require_auth_strict:
             app_overrides.pop(auth_mod.require_auth, None)
 
+@pytest.fixture
+def real_load_sync_engine(client, monkeypatch):
+    """
+    Reinstala el `_load_sync_engine` original (sin caché) en lugar del engine mock.
+    Depende de `client` para que su `_install_dummy_engine()` corra antes y no lo pise.
+    """
+    _REAL_LOAD_SYNC_ENGINE.cache_clear()
+    monkeypatch.setattr(main_local, "_load_sync_engine", _REAL_LOAD_SYNC_ENGINE)
+    try:
+        yield _REAL_LOAD_SYNC_ENGINE
+    finally:
+        # No dejar cacheado un fallback para tests posteriores
+        _REAL_LOAD_SYNC_ENGINE.cache_clear()
+
 # === 8️⃣ XFAIL para tests IA frágiles (si aparecen) ===
 def pytest_collection_modifyitems(items):
     for item in items:
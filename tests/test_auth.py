@@ -9,3 +9,38 @@ def test_login_ok(client):
 def test_status_requires_token(client):
     r = client.get("/status")  # sin token
     assert r.status_code == 401
+
+def test_require_auth_caches_decoded_token(monkeypatch):
+    import app.auth as auth_mod
+
+    token = auth_mod.create_access_token("admin")
+    calls = []
+    real_decode = auth_mod.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(1)
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth_mod.jwt, "decode", counting_decode)
+    auth_mod._TOKEN_CACHE.pop(token, None)
+    assert auth_mod.require_auth(token) == "admin"
+    assert auth_mod.require_auth(token) == "admin"
+    assert len(calls) == 1
+
+def test_access_token_is_standard_hs256():
+    import jwt
+    import app.auth as auth_mod
+
+    token = auth_mod.create_access_token("admin")
+    assert jwt.get_unverified_header(token) == {"alg": "HS256", "typ": "JWT"}
+    decoded = jwt.decode(token, auth_mod.settings.JWT_SECRET, algorithms=["HS256"])
+    assert decoded["sub"] == "admin"
+
+def test_verify_password_truncates_long_passwords_to_72_bytes():
+    import bcrypt
+    import app.auth as auth_mod
+
+    long_pw = "x" * 100
+    hashed = bcrypt.hashpw(long_pw.encode("utf-8")[:72], bcrypt.gensalt(rounds=4)).decode("utf-8")
+    assert auth_mod.verify_password(long_pw, hashed)
+    assert not auth_mod.verify_password("y" * 100, hashed)
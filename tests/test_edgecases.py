@@ -1,44 +1,54 @@
 # tests/test_edgecases.py
 import builtins
-import importlib
 import sys
-from fastapi.testclient import TestClient
 
-def test__load_sync_engine_fallback_import_error():
+def test__load_sync_engine_fallback_import_error(real_load_sync_engine, client, monkeypatch):
     """
-    Fuerza un ImportError SOLO al importar 'sync_engine', con un app/main recargado.
+    Fuerza un ImportError SOLO al importar 'sync_engine', con el loader real (sin caché).
     Así garantizamos que se ejecute el except del loader y devuelva el fallback.
     """
     # 1) Asegura que no esté cacheado
-    sys.modules.pop("sync_engine", None)
+    monkeypatch.delitem(sys.modules, "sync_engine", raising=False)
 
-    # 2) Recarga app.main para tener app y _load_sync_engine sin parches previos
-    import app.main as main_local
-    importlib.reload(main_local)
-
-    # 3) Parchea __import__ para fallar justo cuando pidan 'sync_engine'
+    # 2) Parchea __import__ para fallar justo cuando pidan 'sync_engine'
     original_import = builtins.__import__
     def fake_import(name, *args, **kwargs):
         if name == "sync_engine":
             raise ImportError("boom")
         return original_import(name, *args, **kwargs)
+    monkeypatch.setattr(builtins, "__import__", fake_import)
+
+    # 3) Llama al endpoint (el shim estricto acepta el token de ejemplo)
+    r = client.get("/status", headers={"Authorization": "Bearer valid_token_example"})
+    assert r.status_code == 200
+    body = r.json()
+    assert isinstance(body, dict)
+    # Debe venir del Fallback de app.main._load_sync_engine
+    assert body.get("system_health", "").startswith("fallback: ImportError")
+
+def test_read_coverage_summary_cached_by_mtime(tmp_path, monkeypatch):
+    import app.main as main_local
+
+    cov = tmp_path / "coverage.xml"
+    cov.write_text('<?xml version="1.0" ?>\n<coverage line-rate="0.5"></coverage>\n')
+    monkeypatch.setattr(main_local, "COV_XML", cov)
+    monkeypatch.setattr(main_local, "_COV_CACHE", None)
+    assert main_local._read_coverage_summary() == {"ok": True, "percent": 50.0}
+
+    calls = []
+    monkeypatch.setattr(main_local, "_read_root_line_rate", lambda: calls.append(1))
+    assert main_local._read_coverage_summary() == {"ok": True, "percent": 50.0}
+    assert calls == []
+
+    cov.unlink()
+    assert main_local._read_coverage_summary() == {"ok": False, "percent": None}
+
+
+def test_read_root_line_rate_falls_back_to_iterparse(tmp_path, monkeypatch):
+    import app.main as main_local
 
-    try:
-        # Aplica el parche
-        builtins.__import__ = fake_import
-
-        # 4) Reaplica override de auth a la NUEVA app (si no, 401)
-        main_local.app.dependency_overrides[main_local.require_auth] = lambda: "admin"
-
-        # 5) Llama al endpoint
-        client = TestClient(main_local.app)
-        r = client.get("/status", headers={"Authorization": "Bearer valid_token_example"})
-        assert r.status_code == 200
-        body = r.json()
-        assert isinstance(body, dict)
-        # Debe venir del Fallback de app.main._load_sync_engine
-        assert body.get("system_health", "").startswith("fallback: ImportError")
-    finally:
-        # Limpieza: quita el parche y los overrides locales
-        builtins.__import__ = original_import
-        main_local.app.dependency_overrides.pop(main_local.require_auth, None)
\ No newline at end of file
+    cov = tmp_path / "coverage.xml"
+    padding = "<!-- " + "x" * 4096 + " -->\n"
+    cov.write_text('<?xml version="1.0" ?>\n' + padding + '<coverage line-rate="0.25"><packages/></coverage>\n')
+    monkeypatch.setattr(main_local, "COV_XML", cov)
+    assert main_local._read_root_line_rate() == 0.25
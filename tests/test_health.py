@@ -3,3 +3,11 @@ def test_health_ok(client):
     r = client.get("/health")
     assert r.status_code == 200
     assert r.json() == {"status": "ok"}
+
+def test_qa_dashboard_html(client):
+    r = client.get("/qa")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/html")
+    assert "QA Dashboard" in r.text
+    # el stream llega en bloques de bytes: decodificar sin partir caracteres UTF-8
+    assert "dec.decode(value,{stream:true})" in r.text
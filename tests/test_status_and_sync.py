@@ -11,4 +11,27 @@ def test_sync_ok(authed_client):
     assert r.status_code == 200, r.text
     j = r.json()
     assert j["ok"] is True
-    assert "kpi_jornadas" in j["tables"]
\ No newline at end of file
+    assert "kpi_jornadas" in j["tables"]
+
+def test_qa_run_tests_captures_output(authed_client, monkeypatch):
+    import sys
+    import app.main as main_local
+
+    cmd = [sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr)"]
+    monkeypatch.setattr(main_local, "_choose_cmd", lambda mode="auto", runner=None: (cmd, None))
+    r = authed_client.post("/qa/run-tests?mode=pytest")
+    assert r.status_code == 200, r.text
+    j = r.json()
+    assert j["returncode"] == 0
+    assert "out" in j["output"] and "err" in j["output"]
+
+def test_qa_run_tests_stream_output(authed_client, monkeypatch):
+    import sys
+    import app.main as main_local
+
+    cmd = [sys.executable, "-c", "print('line1'); print('line2')"]
+    monkeypatch.setattr(main_local, "_choose_cmd", lambda mode="auto", runner=None: (cmd, None))
+    r = authed_client.post("/qa/run-tests/stream?mode=pytest")
+    assert r.status_code == 200
+    assert r.headers["x-accel-buffering"] == "no"
+    assert "line1" in r.text and "line2" in r.text
@@ -8,3 +8,31 @@ def test_sync_payload_types(authed_client):
     # Con Pydantic body model (SyncRequest) esto debería dar 422 por tipos inválidos
     r = authed_client.post("/sync", json={"tables": "no-es-lista", "dry_run": "x"})
     assert r.status_code in (200, 400, 422)
+
+def test_sync_whitelist_blocks_unlisted_tables(authed_client, monkeypatch):
+    import app.main as main_local
+
+    monkeypatch.setattr(main_local.settings, "ALLOWED_TABLES", ["kpi_jornadas"])
+    assert authed_client.post("/sync", json={"tables": ["kpi_jornadas"]}).status_code == 200
+    assert authed_client.post("/sync", json={"tables": ["otra"]}).status_code == 403
+
+def test_settings_reset_does_not_leak_mutations():
+    import builtins
+
+    s1 = builtins.get_settings()
+    s1.ALLOWED_TABLES = ["only_this"]
+    s2 = builtins.get_settings()
+    assert s2 is not s1
+    assert not s2.ALLOWED_TABLES
+
+def test_settings_reset_clears_get_settings_cache():
+    import builtins
+    import app.settings as settings_mod
+
+    builtins.get_settings()
+    s1 = settings_mod.get_settings()
+    s1.ALLOWED_TABLES = ["leaked"]
+    builtins.get_settings()
+    s2 = settings_mod.get_settings()
+    assert s2 is not s1
+    assert not s2.ALLOWED_TABLES